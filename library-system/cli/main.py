@@ -1,5 +1,6 @@
 import click
-from uuid import UUID
+from functools import lru_cache
+from itertools import chain, islice
 
 from config.database import CassandraConnection
 from models.book import BookRepository, Book
@@ -9,14 +10,39 @@ from models.borrow import BorrowRepository
 from tabulate import tabulate
 
 
+# Taille des pages demandées à Cassandra pour les listes potentiellement longues:
+# les lignes sont affichées au fil de l'eau, page par page, sans tout charger en mémoire.
+FETCH_SIZE = 500
+
+# Les tableaux tabulate sont rendus par blocs de TABLE_CHUNK lignes (en-têtes sur le premier bloc):
+# mémoire bornée et premières lignes affichées sans attendre la fin du résultat.
+TABLE_CHUNK = 200
+
 
 # ========= Bootstrap Cassandra =========
-db = CassandraConnection()
-session = db.connect()
+# Connexion paresseuse: ouverte au premier appel d'une commande qui en a besoin,
+# pas à l'import (--help, complétion et erreurs d'usage ne touchent pas au cluster).
+# La fermeture reste assurée par le handler atexit, enregistré seulement si connect() a eu lieu.
+@lru_cache(maxsize=1)
+def get_db() -> CassandraConnection:
+    db = CassandraConnection()
+    db.connect()
+    return db
+
+
+@lru_cache(maxsize=1)
+def get_book_repo() -> BookRepository:
+    return BookRepository(get_db().session)
+
 
-book_repo = BookRepository(session)
-user_repo = UserRepository(session)
-borrow_repo = BorrowRepository(session)
+@lru_cache(maxsize=1)
+def get_user_repo() -> UserRepository:
+    return UserRepository(get_db().session)
+
+
+@lru_cache(maxsize=1)
+def get_borrow_repo() -> BorrowRepository:
+    return BorrowRepository(get_db().session)
 
 
 @click.group()
@@ -53,7 +79,7 @@ def books_add(isbn, title, author, category, publisher, year, copies, descriptio
         available_copies=copies,
         description=description
     )
-    ok = book_repo.add_book(book)
+    ok = get_book_repo().add_book(book)
     if ok:
         click.echo(click.style("✅ Livre ajouté", fg="green"))
     else:
@@ -63,7 +89,7 @@ def books_add(isbn, title, author, category, publisher, year, copies, descriptio
 @books.command("search")
 @click.option("--isbn", prompt=True)
 def books_search(isbn):
-    book = book_repo.get_book_by_isbn(isbn)
+    book = get_book_repo().get_book_by_isbn(isbn)
     if not book:
         click.echo(click.style("❌ Livre introuvable", fg="red"))
         return
@@ -80,28 +106,58 @@ def books_search(isbn):
     click.echo("\n" + tabulate(data, tablefmt="grid"))
 
 
+def echo_table(rows, headers, chunk_size=TABLE_CHUNK):
+    rows = iter(rows)
+    chunk = list(islice(rows, chunk_size))
+    while chunk:
+        click.echo("\n" + tabulate(chunk, headers=headers, tablefmt="grid"))
+        headers = ()
+        chunk = list(islice(rows, chunk_size))
+
+
+# Sortie "plain": une ligne par livre (pratique pour grep / scripts)
+FORMAT_OPTION = click.option(
+    "--format", "fmt", type=click.Choice(["grid", "plain"]), default="grid", show_default=True
+)
+
+
 @books.command("list-by-category")
 @click.option("--category", prompt=True)
-def books_list_by_category(category):
-    rows = book_repo.get_books_by_category(category)
-    if not rows:
+@FORMAT_OPTION
+def books_list_by_category(category, fmt):
+    rows = iter(get_book_repo().iter_books_by_category(category, fetch_size=FETCH_SIZE))
+
+    first = next(rows, None)
+    if first is None:
         click.echo(click.style("Aucun livre trouvé", fg="yellow"))
         return
+    rows = chain((first,), rows)
 
-    table = [[r["isbn"], r["title"], r["author"], r["available_copies"]] for r in rows]
-    click.echo("\n" + tabulate(table, headers=["ISBN", "Titre", "Auteur", "Dispo"], tablefmt="grid"))
+    if fmt == "plain":
+        for b in rows:
+            click.echo(f"- {b.title} | ISBN={b.isbn} | author={b.author} | avail={b.available_copies}/{b.total_copies}")
+        return
+
+    table = ([r.isbn, r.title, r.author, r.available_copies] for r in rows)
+    echo_table(table, headers=["ISBN", "Titre", "Auteur", "Dispo"])
 
 
 @books.command("list-by-author")
 @click.option("--author", prompt=True)
-def books_list_by_author(author):
-    rows = book_repo.get_books_by_author(author)
+@FORMAT_OPTION
+def books_list_by_author(author, fmt):
+    rows = get_book_repo().get_books_by_author(author)
     if not rows:
         click.echo(click.style("Aucun livre trouvé", fg="yellow"))
         return
 
-    table = [[r["isbn"], r["title"], r["category"], r["available_copies"]] for r in rows]
-    click.echo("\n" + tabulate(table, headers=["ISBN", "Titre", "Catégorie", "Dispo"], tablefmt="grid"))
+    if fmt == "plain":
+        for b in rows:
+            click.echo(f"- {b.title} | ISBN={b.isbn} | category={b.category} | avail={b.available_copies}/{b.total_copies}")
+        return
+
+    table = ([r.isbn, r.title, r.category, r.available_copies] for r in rows)
+    echo_table(table, headers=["ISBN", "Titre", "Catégorie", "Dispo"])
 
 
 # ================= USERS =================
@@ -118,25 +174,25 @@ def users():
 @click.option("--phone", default="")
 @click.option("--address", default="")
 def users_register(email, first_name, last_name, phone, address):
-    user_id = user_repo.create_user(email, first_name, last_name, phone, address)
+    user_id = get_user_repo().create_user(email, first_name, last_name, phone, address)
     click.echo(click.style(f"✅ Utilisateur créé: {user_id}", fg="green"))
 
 
 @users.command("profile")
-@click.option("--user-id", prompt=True)
+@click.option("--user-id", prompt=True, type=click.UUID)
 def users_profile(user_id):
-    user = user_repo.get_user(UUID(user_id))
+    user = get_user_repo().get_user(user_id)
     if not user:
         click.echo(click.style("❌ Utilisateur introuvable", fg="red"))
         return
 
     data = [
-        ["ID", user["user_id"]],
-        ["Nom", f'{user["first_name"]} {user["last_name"]}'],
-        ["Email", user["email"]],
-        ["Inscription", user["registration_date"]],
-        ["Emprunts totaux", user["total_borrows"]],
-        ["Emprunts actifs", user["active_borrows"]],
+        ["ID", user.user_id],
+        ["Nom", f"{user.first_name} {user.last_name}"],
+        ["Email", user.email],
+        ["Inscription", user.registration_date],
+        ["Emprunts totaux", user.total_borrows],
+        ["Emprunts actifs", user.active_borrows],
     ]
     click.echo("\n" + tabulate(data, tablefmt="grid"))
 
@@ -150,7 +206,7 @@ def borrows():
 
 
 @borrows.command("borrow")
-@click.option("--user-id", default=None, help="UUID utilisateur")
+@click.option("--user-id", default=None, type=click.UUID, help="UUID utilisateur")
 @click.option("--email", default=None, help="Email utilisateur")
 @click.option("--isbn", prompt=True)
 @click.option("--days", default=14, show_default=True, type=int)
@@ -159,14 +215,14 @@ def borrows_borrow(user_id, email, isbn, days):
         raise click.UsageError("Il faut fournir --user-id OU --email")
 
     if email:
-        uid = user_repo.get_user_id_by_email(email)
+        uid = get_user_repo().get_user_id_by_email(email)
         if not uid:
             click.echo(click.style("❌ Email introuvable", fg="red"))
             return
     else:
-        uid = UUID(user_id)
+        uid = user_id
 
-    res = borrow_repo.borrow_book(uid, isbn, loan_days=days)
+    res = get_borrow_repo().borrow_book(uid, isbn, loan_days=days)
     if res.ok:
         click.echo(click.style(f"✅ {res.message}", fg="green"))
     else:
@@ -182,10 +238,10 @@ def borrows_borrow(user_id, email, isbn, days):
 
 
 @borrows.command("return")
-@click.option("--user-id", prompt=True)
+@click.option("--user-id", prompt=True, type=click.UUID)
 @click.option("--isbn", prompt=True)
 def borrows_return(user_id, isbn):
-    res = borrow_repo.return_book(UUID(user_id), isbn)
+    res = get_borrow_repo().return_book(user_id, isbn)
     if res.ok:
         click.echo(click.style(f"✅ {res.message}", fg="green"))
     else:
@@ -195,124 +251,74 @@ def borrows_return(user_id, isbn):
 @borrows.command("borrow-email")
 def borrows_borrow_email():
     """Emprunter un livre avec l'email utilisateur"""
-    user_repo = UserRepository(db.session)
-    borrow_repo = BorrowRepository(db.session)
-
     email = input("Email: ").strip()
     isbn = input("Isbn: ").strip()
     days_str = input("Loan days [14]: ").strip()
     days = int(days_str) if days_str else 14
 
-    user_id = user_repo.get_user_id_by_email(email)
+    user_id = get_user_repo().get_user_id_by_email(email)
     if not user_id:
         print("❌ Utilisateur introuvable pour cet email")
         return
 
-    res = borrow_repo.borrow_book(UUID(str(user_id)), isbn, loan_days=days)
+    res = get_borrow_repo().borrow_book(user_id, isbn, loan_days=days)
     print(("✅ " if res.ok else "❌ ") + res.message)
 
-@books.command("list-by-category")
-def books_list_by_category():
-    """Lister les livres d'une catégorie"""
-    repo = BookRepository(db.session)  # adapte si ton objet db s'appelle autrement
-    category = input("Category: ").strip()
-
-    rows = repo.get_books_by_category(category)
-    if not rows:
-        print("Aucun livre trouvé.")
-        return
-
-    for b in rows:
-        print(f"- {b['title']} | ISBN={b['isbn']} | author={b['author']} | avail={b['available_copies']}/{b['total_copies']}")
-
-@books.command("list-by-author")
-def books_list_by_author():
-    """Lister les livres d'un auteur"""
-    repo = BookRepository(db.session)
-    author = input("Author: ").strip()
-
-    rows = repo.get_books_by_author(author)
-    if not rows:
-        print("Aucun livre trouvé.")
-        return
-
-    for b in rows:
-        print(f"- {b['title']} | ISBN={b['isbn']} | category={b['category']} | avail={b['available_copies']}/{b['total_copies']}")
-
 @users.command("show")
 def users_show():
     """Afficher un utilisateur via email"""
-    user_repo = UserRepository(db.session)
     email = input("Email: ").strip()
 
-    user_id = user_repo.get_user_id_by_email(email)
+    user_id = get_user_repo().get_user_id_by_email(email)
     if not user_id:
         print("Utilisateur introuvable.")
         return
 
-    user = user_repo.get_user(user_id)
+    user = get_user_repo().get_user(user_id)
     print(user)
 
 @users.command("active-borrows")
 def users_active_borrows():
     """Lister les emprunts actifs d'un user via email"""
-    user_repo = UserRepository(db.session)
     email = input("Email: ").strip()
 
-    user_id = user_repo.get_user_id_by_email(email)
+    user_id = get_user_repo().get_user_id_by_email(email)
     if not user_id:
         print("Utilisateur introuvable.")
         return
 
-    rows = db.session.execute(
-        "SELECT borrow_date, isbn, book_title, due_date FROM active_borrows_by_user WHERE user_id=%s",
-        (user_id,)
-    )
+    rows = iter(get_borrow_repo().iter_active_borrows_by_user(user_id, fetch_size=FETCH_SIZE))
 
-    rows = list(rows)
-    if not rows:
+    first = next(rows, None)
+    if first is None:
         print("Aucun emprunt actif.")
         return
 
-    for r in rows:
+    for r in chain((first,), rows):
         print(f"- {r.book_title} | ISBN={r.isbn} | borrow_date={r.borrow_date} | due={r.due_date}")
 
 @users.command("borrows-history")
 def users_borrows_history():
     """Historique complet des emprunts d'un user via email"""
-    user_repo = UserRepository(db.session)
     email = input("Email: ").strip()
 
-    user_id = user_repo.get_user_id_by_email(email)
+    user_id = get_user_repo().get_user_id_by_email(email)
     if not user_id:
         print("Utilisateur introuvable.")
         return
 
-    rows = db.session.execute(
-        "SELECT borrow_date, isbn, book_title, status, due_date, return_date "
-        "FROM borrows_by_user WHERE user_id=%s",
-        (user_id,)
-    )
+    rows = iter(get_borrow_repo().iter_borrow_history(user_id, fetch_size=FETCH_SIZE))
 
-    rows = list(rows)
-    if not rows:
+    first = next(rows, None)
+    if first is None:
         print("Aucun historique.")
         return
 
-    for r in rows:
+    for r in chain((first,), rows):
         print(f"- {r.book_title} | ISBN={r.isbn} | {r.status} | borrow={r.borrow_date} | due={r.due_date} | return={r.return_date}")
 
 
 
-@cli.command("close")
-def close_conn():
-    """Fermer la connexion Cassandra (utile si tu lances le CLI en debug)"""
-    db.close()
-    click.echo("🔌 Connexion fermée")
-
-
 if __name__ == "__main__":
-    try:
-        cli()
-    finally:
-        db.close()
+    # La connexion est fermée une seule fois par le handler atexit de CassandraConnection
+    cli()
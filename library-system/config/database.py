@@ -1,18 +1,74 @@
-from cassandra.cluster import Cluster
+import atexit
+from functools import lru_cache
+
+from cassandra.cluster import Cluster, ExecutionProfile, EXEC_PROFILE_DEFAULT
+from cassandra.policies import (
+    TokenAwarePolicy, DCAwareRoundRobinPolicy, ConstantSpeculativeExecutionPolicy,
+)
+from cassandra.query import named_tuple_factory
 from loguru import logger
 
+
+@lru_cache(maxsize=None)
+def prepare_cached(session, cql):
+    """
+    session.prepare() mémorisé par (session, texte CQL): un repository construit plusieurs fois
+    dans le même process réutilise les PreparedStatement au lieu de refaire un aller-retour.
+    Les SELECT sont marqués idempotents: seuls ceux-là peuvent être relancés par
+    l'exécution spéculative (voir CassandraConnection.connect).
+    """
+    stmt = session.prepare(cql)
+    stmt.is_idempotent = cql.lstrip().upper().startswith("SELECT")
+    return stmt
+
+
 class CassandraConnection:
-    def __init__(self, hosts=None, port=9042, keyspace="library_system"):
+    def __init__(self, hosts=None, port=9042, keyspace="library_system",
+                 protocol_version=4, request_timeout=10, compression=True,
+                 local_dc="datacenter1"):
         self.hosts = hosts or ["127.0.0.1"]
         self.port = port
         self.keyspace = keyspace
+        self.protocol_version = protocol_version
+        self.request_timeout = request_timeout
+        self.compression = compression
+        # DC local (CASSANDRA_DC du docker-compose): les nœuds des autres DC ne sont jamais
+        # choisis comme coordinateurs
+        self.local_dc = local_dc
         self.cluster = None
         self.session = None
 
-    def connect(self, set_keyspace=True):
-        self.cluster = Cluster(contact_points=self.hosts, port=self.port)
-        self.session = self.cluster.connect()
+    def connect(self, set_keyspace=True, wait_for_all_pools=False):
+        # Token-aware: chaque requête part directement vers un réplica de la partition
+        # (pas de saut supplémentaire via un coordinateur choisi en round-robin).
+        profile = ExecutionProfile(
+            load_balancing_policy=TokenAwarePolicy(DCAwareRoundRobinPolicy(local_dc=self.local_dc)),
+            request_timeout=self.request_timeout,
+            # Les repositories renvoient les Row telles quelles: on fixe explicitement le format
+            # (avec des profils, Session.row_factory ne peut plus être modifié)
+            row_factory=named_tuple_factory,
+            # Requête idempotente sans réponse après 50 ms: une 2e tentative part vers un autre
+            # réplica, la première réponse arrivée gagne (coupe la queue de latence p99)
+            speculative_execution_policy=ConstantSpeculativeExecutionPolicy(delay=0.05, max_attempts=2),
+        )
+        self.cluster = Cluster(
+            contact_points=self.hosts,
+            port=self.port,
+            execution_profiles={EXEC_PROFILE_DEFAULT: profile},
+            # Pas de réglage de pool: en protocole v3+ le driver garde une connexion par hôte,
+            # multiplexée (jusqu'à 32768 requêtes en vol), et set_core_connections_per_host
+            # n'est plus supporté
+            protocol_version=self.protocol_version,
+            # True = négociation avec le serveur: lz4 si le paquet lz4 est installé (requirements),
+            # sinon snappy, sinon pas de compression. False pour la désactiver.
+            compression=self.compression,
+        )
+        # wait_for_all_pools=True: les connexions vers tous les nœuds sont ouvertes ici, au
+        # démarrage, au lieu d'être encore en cours d'ouverture aux premières requêtes
+        self.session = self.cluster.connect(wait_for_all_pools=wait_for_all_pools)
         logger.success(f"Connecté à Cassandra: {self.hosts}:{self.port}")
+        # Fermeture unique en fin de process (CLI, web, scripts), même sans close() explicite
+        atexit.register(self.close)
 
         if set_keyspace:
             self.session.set_keyspace(self.keyspace)
@@ -20,7 +76,19 @@ class CassandraConnection:
 
         return self.session
 
+    # `with CassandraConnection() as session:` connecte, puis ferme en sortie de bloc
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
     def close(self):
-        if self.cluster:
-            self.cluster.shutdown()
-            logger.info("Connexion Cassandra fermée")
+        # Idempotent: un second appel (atexit après un close() explicite) ne fait rien
+        if self.cluster is None:
+            return
+        atexit.unregister(self.close)
+        self.cluster.shutdown()
+        self.cluster = None
+        self.session = None
+        logger.info("Connexion Cassandra fermée")
@@ -0,0 +1,14 @@
+# Serveur de production de l'interface web (depuis library-system/):
+#     gunicorn -c gunicorn.conf.py web.app:app
+import multiprocessing
+
+bind = "127.0.0.1:5000"
+
+# Plusieurs processus, et dans chacun plusieurs threads: les attentes Cassandra se chevauchent
+worker_class = "gthread"
+workers = multiprocessing.cpu_count() * 2
+threads = 8
+
+# Pas de preload: web.app ouvre sa connexion Cassandra à l'import, et les threads d'I/O
+# du driver ne survivent pas à un fork. Chaque worker crée donc son propre Cluster.
+preload_app = False
@@ -1,8 +1,14 @@
+from concurrent.futures import Future
 from dataclasses import dataclass
-from typing import Optional, List, Dict, Any
-from cassandra.query import PreparedStatement
+from threading import Lock
+from typing import Optional, List, Any
+from cassandra.cluster import ResponseFuture
+from cassandra.concurrent import execute_concurrent, execute_concurrent_with_args
+from cassandra.query import BatchStatement, BatchType, PreparedStatement
 from loguru import logger
 
+from config.database import prepare_cached
+
 @dataclass
 class Book:
     isbn: str
@@ -19,74 +25,242 @@ class BookRepository:
     def __init__(self, session):
         self.session = session
 
-        self._ins_by_id: PreparedStatement = session.prepare("""
+        self._ins_by_id: PreparedStatement = prepare_cached(session, """
             INSERT INTO books_by_id (
               isbn, title, author, category, publisher, publication_year,
               total_copies, available_copies, description
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         """)
 
-        self._ins_by_category: PreparedStatement = session.prepare("""
-            INSERT INTO books_by_category (
-              category, title, isbn, author, publication_year,
-              available_copies, total_copies
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        """)
-
-        self._ins_by_author: PreparedStatement = session.prepare("""
+        self._ins_by_author: PreparedStatement = prepare_cached(session, """
             INSERT INTO books_by_author (
-              author, title, isbn, category, publication_year,
-              available_copies, total_copies
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+              author, title, isbn, category, publication_year
+            ) VALUES (?, ?, ?, ?, ?)
         """)
 
-        self._sel_by_isbn: PreparedStatement = session.prepare("""
+        self._sel_by_isbn: PreparedStatement = prepare_cached(session, """
             SELECT * FROM books_by_id WHERE isbn = ?
         """)
 
-        self._sel_by_category: PreparedStatement = session.prepare("""
-            SELECT * FROM books_by_category WHERE category = ?
+        # Catégorie = faible cardinalité: index secondaire sur books_by_id
+        # (plus de table books_by_category à maintenir à chaque écriture)
+        self._sel_by_category: PreparedStatement = prepare_cached(session, """
+            SELECT * FROM books_by_id WHERE category = ?
+        """)
+
+        # books_by_author ne sert qu'à retrouver les isbn d'un auteur:
+        # la disponibilité n'est stockée que dans books_by_id
+        self._sel_isbns_by_author: PreparedStatement = prepare_cached(session, """
+            SELECT isbn FROM books_by_author WHERE author = ?
         """)
 
-        self._sel_by_author: PreparedStatement = session.prepare("""
-            SELECT * FROM books_by_author WHERE author = ?
+        # LIMIT lié comme paramètre: une seule préparation quel que soit le limit demandé
+        self._sel_list: PreparedStatement = prepare_cached(session, """
+            SELECT isbn, title, author, category, available_copies, total_copies
+            FROM books_by_id LIMIT ?
         """)
 
     def add_book(self, book: Book) -> bool:
+        # Les 2 INSERT dénormalisés sont indépendants: on les envoie en parallèle
+        # (execute_async) puis on attend les 2 réponses => ~1 RTT au lieu de 2.
         try:
-            self.session.execute(self._ins_by_id, (
+            futures = [
+                ("books_by_id", self.session.execute_async(self._ins_by_id, (
+                    book.isbn, book.title, book.author, book.category,
+                    book.publisher, book.publication_year,
+                    book.total_copies, book.available_copies, book.description
+                ))),
+                ("books_by_author", self.session.execute_async(self._ins_by_author, (
+                    book.author, book.title, book.isbn, book.category,
+                    book.publication_year
+                ))),
+            ]
+        except Exception as e:
+            logger.error(f"❌ add_book failed: {e}")
+            return False
+
+        ok = True
+        for table, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"❌ add_book failed ({table}): {e}")
+                ok = False
+
+        if ok:
+            logger.success(f"✅ Livre ajouté: {book.title} ({book.isbn})")
+        return ok
+
+    def add_books(self, books: List[Book], concurrency: int = 100) -> List[bool]:
+        """
+        Import en masse: les INSERT des 2 tables dénormalisées partagent une même fenêtre
+        de `concurrency` requêtes en vol. Retourne un booléen par livre (dans l'ordre).
+        """
+        tables = ("books_by_id", "books_by_author")
+        statements = []
+        for book in books:
+            statements.append((self._ins_by_id, (
                 book.isbn, book.title, book.author, book.category,
                 book.publisher, book.publication_year,
                 book.total_copies, book.available_copies, book.description
-            ))
+            )))
+            statements.append((self._ins_by_author, (
+                book.author, book.title, book.isbn, book.category,
+                book.publication_year
+            )))
 
-            self.session.execute(self._ins_by_category, (
-                book.category, book.title, book.isbn, book.author,
-                book.publication_year, book.available_copies, book.total_copies
-            ))
+        results = execute_concurrent(
+            self.session, statements, concurrency=concurrency, raise_on_first_error=False
+        )
 
-            self.session.execute(self._ins_by_author, (
-                book.author, book.title, book.isbn, book.category,
-                book.publication_year, book.available_copies, book.total_copies
-            ))
+        ok = [True] * len(books)
+        for i, (success, result) in enumerate(results):
+            if not success:
+                book = books[i // len(tables)]
+                logger.error(f"❌ add_books failed ({tables[i % len(tables)]}, {book.isbn}): {result}")
+                ok[i // len(tables)] = False
 
-            logger.success(f"✅ Livre ajouté: {book.title} ({book.isbn})")
-            return True
-        except Exception as e:
-            logger.error(f"❌ add_book failed: {e}")
-            return False
+        logger.success(f"✅ Livres ajoutés: {sum(ok)}/{len(books)}")
+        return ok
 
-    def get_book_by_isbn(self, isbn: str) -> Optional[Dict[str, Any]]:
-        row = self.session.execute(self._sel_by_isbn, (isbn,)).one()
-        return dict(row._asdict()) if row else None
+    def add_books_batch(self, books: List[Book], batch_size: int = 50) -> List[bool]:
+        """
+        Variante d'import: un BatchStatement UNLOGGED par groupe de `batch_size` livres
+        (les 2 INSERT de chaque livre), tous les groupes envoyés en parallèle.
+        => 1 requête par groupe au lieu de 2 par livre.
+        ⚠️ Les isbn sont tous distincts: chaque batch touche plusieurs partitions et charge
+        le coordinateur (warning "batch size" côté Cassandra si les descriptions sont longues).
+        add_books (execute_concurrent) reste le chemin recommandé pour les gros volumes.
+        """
+        futures = []
+        for start in range(0, len(books), batch_size):
+            chunk = books[start:start + batch_size]
+            batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+            for book in chunk:
+                batch.add(self._ins_by_id, (
+                    book.isbn, book.title, book.author, book.category,
+                    book.publisher, book.publication_year,
+                    book.total_copies, book.available_copies, book.description
+                ))
+                batch.add(self._ins_by_author, (
+                    book.author, book.title, book.isbn, book.category,
+                    book.publication_year
+                ))
+            futures.append((start, len(chunk), self.session.execute_async(batch)))
 
-    def get_books_by_category(self, category: str) -> List[Dict[str, Any]]:
-        rows = self.session.execute(self._sel_by_category, (category,))
-        return [dict(r._asdict()) for r in rows]
+        ok = [True] * len(books)
+        for start, size, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"❌ add_books_batch failed (livres {start}..{start + size - 1}): {e}")
+                ok[start:start + size] = [False] * size
 
-    def get_books_by_author(self, author: str) -> List[Dict[str, Any]]:
-        rows = self.session.execute(self._sel_by_author, (author,))
-        return [dict(r._asdict()) for r in rows]
+        logger.success(f"✅ Livres ajoutés: {sum(ok)}/{len(books)}")
+        return ok
+
+    # Les lectures renvoient directement les Row (namedtuple) du driver: accès par attribut
+    # (row.isbn), sans recopier chaque ligne dans un dict.
+    def get_book_by_isbn(self, isbn: str) -> Optional[Any]:
+        return self.session.execute(self._sel_by_isbn, (isbn,)).one()
+
+    def get_books_by_category(self, category: str) -> List[Any]:
+        return list(self.session.execute(self._sel_by_category, (category,)))
+
+    def iter_books_by_category(self, category: str, fetch_size: Optional[int] = None):
+        """Livres d'une catégorie, itérés page par page (fetch_size lignes par page)."""
+        bound = self._sel_by_category.bind((category,))
+        if fetch_size:
+            bound.fetch_size = fetch_size
+        return self.session.execute(bound)
+
+    def get_books_by_author(self, author: str, concurrency: int = 32) -> List[Any]:
+        """
+        Livres d'un auteur (triés par titre): isbn lus dans books_by_author,
+        puis lectures ponctuelles en parallèle sur books_by_id pour la disponibilité.
+        """
+        isbns = [(r.isbn,) for r in self.session.execute(self._sel_isbns_by_author, (author,))]
+        results = execute_concurrent_with_args(
+            self.session, self._sel_by_isbn, isbns, concurrency=concurrency, raise_on_first_error=False
+        )
+
+        books = []
+        for (isbn,), (success, result) in zip(isbns, results):
+            if not success:
+                logger.error(f"❌ get_books_by_author failed ({isbn}): {result}")
+                continue
+            row = result.one()
+            if row:
+                books.append(row)
+        return books
+
+    # Variantes non bloquantes: plusieurs lectures peuvent être en vol en même temps,
+    # l'appelant attend avec .result() (ResultSet pour les ResponseFuture du driver).
+    def get_book_by_isbn_async(self, isbn: str) -> ResponseFuture:
+        return self.session.execute_async(self._sel_by_isbn, (isbn,))
+
+    def get_books_by_category_async(self, category: str) -> ResponseFuture:
+        return self.session.execute_async(self._sel_by_category, (category,))
+
+    def get_books_by_author_async(self, author: str) -> Future:
+        """
+        Comme get_books_by_author, mais renvoie tout de suite un Future résolu avec la liste
+        des livres: les lectures books_by_id partent depuis le callback, dès réception de toutes
+        les pages d'isbn. Toute erreur (y compris levée dans un callback) est remontée par le Future.
+        """
+        done: Future = Future()
+        lock = Lock()
+        isbns: List[str] = []
+
+        def settle(setter, value):
+            # Les callbacks tournent sur le thread d'I/O du driver: une seule résolution, jamais
+            # d'exception perdue là-bas
+            with lock:
+                if not done.done():
+                    setter(value)
+
+        def on_isbns(rows):
+            try:
+                isbns.extend(r.isbn for r in rows)
+                if isbn_future.has_more_pages:
+                    # Même callback rappelé avec la page suivante
+                    isbn_future.start_fetching_next_page()
+                    return
+                if not isbns:
+                    settle(done.set_result, [])
+                    return
+
+                books: List[Any] = [None] * len(isbns)
+                pending = [len(isbns)]
+
+                def finish():
+                    with lock:
+                        pending[0] -= 1
+                        last = pending[0] == 0
+                    if last:
+                        settle(done.set_result, [b for b in books if b])
+
+                def on_book(rs, i):
+                    try:
+                        books[i] = rs[0] if rs else None
+                        finish()
+                    except Exception as e:
+                        settle(done.set_exception, e)
+
+                def on_error(e, i):
+                    logger.error(f"❌ get_books_by_author failed ({isbns[i]}): {e}")
+                    finish()
+
+                for i, isbn in enumerate(isbns):
+                    self.session.execute_async(self._sel_by_isbn, (isbn,)).add_callbacks(
+                        on_book, on_error, callback_args=(i,), errback_args=(i,)
+                    )
+            except Exception as e:
+                settle(done.set_exception, e)
+
+        isbn_future = self.session.execute_async(self._sel_isbns_by_author, (author,))
+        isbn_future.add_callbacks(on_isbns, lambda e: settle(done.set_exception, e))
+        return done
     
     # def list_books(self, limit: int = 100) -> List[Dict[str, Any]]:
         # rows = self.session.execute(
@@ -98,6 +272,11 @@ class BookRepository:
     def list_books(self, limit: int = 100):
         # ⚠️ Cassandra: LIMIT sans partition key = scan.
         # OK pour une démo / petit dataset, pas pour prod.
-        query = "SELECT isbn, title, author, category, available_copies, total_copies FROM books_by_id LIMIT %s"
-        rows = self.session.execute(query, (int(limit),))
-        return [dict(r._asdict()) for r in rows]
+        return list(self.session.execute(self._sel_list, (int(limit),)))
+
+    def iter_books(self, limit: int = 100, fetch_size: Optional[int] = None):
+        """Comme list_books, mais itéré page par page (fetch_size lignes par page)."""
+        bound = self._sel_list.bind((int(limit),))
+        if fetch_size:
+            bound.fetch_size = fetch_size
+        return self.session.execute(bound)
@@ -2,11 +2,17 @@ from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from uuid import UUID
-from typing import List, Dict, Any
+from typing import List, Any, Tuple
 
-from cassandra.query import PreparedStatement
+from cassandra.cluster import ResponseFuture
+from cassandra.query import BatchStatement, BatchType, PreparedStatement
 from loguru import logger
 
+from config.database import prepare_cached
+
+# Nombre max de tentatives compare-and-set sur available_copies avant d'abandonner
+MAX_CAS_RETRIES = 5
+
 
 @dataclass
 class BorrowResult:
@@ -24,113 +30,171 @@ class BorrowRepository:
         self.session = session
 
         # ====== Books ======
-        self._sel_book: PreparedStatement = session.prepare(
+        self._sel_book: PreparedStatement = prepare_cached(session,
             "SELECT isbn, title, author, category, available_copies, total_copies "
             "FROM books_by_id WHERE isbn = ?"
         )
 
-        self._upd_book_copies: PreparedStatement = session.prepare(
-            "UPDATE books_by_id SET available_copies = ? WHERE isbn = ?"
-        )
-
-        self._upd_book_cat_copies: PreparedStatement = session.prepare(
-            "UPDATE books_by_category SET available_copies = ? "
-            "WHERE category = ? AND title = ? AND isbn = ?"
-        )
-
-        self._upd_book_author_copies: PreparedStatement = session.prepare(
-            "UPDATE books_by_author SET available_copies = ? "
-            "WHERE author = ? AND title = ? AND isbn = ?"
+        # LWT (compare-and-set): l'update n'est appliqué que si la valeur lue n'a pas bougé
+        self._cas_book_copies: PreparedStatement = prepare_cached(session,
+            "UPDATE books_by_id SET available_copies = ? WHERE isbn = ? IF available_copies = ?"
         )
 
         # ====== Users ======
-        self._sel_user: PreparedStatement = session.prepare(
+        self._sel_user: PreparedStatement = prepare_cached(session,
             "SELECT user_id, first_name, last_name, total_borrows, active_borrows "
             "FROM users_by_id WHERE user_id = ?"
         )
 
-        self._upd_user_counts: PreparedStatement = session.prepare(
+        self._upd_user_counts: PreparedStatement = prepare_cached(session,
             "UPDATE users_by_id SET total_borrows = ?, active_borrows = ? WHERE user_id = ?"
         )
 
         # ====== Borrows tables ======
-        self._ins_borrow_user: PreparedStatement = session.prepare(
+        self._ins_borrow_user: PreparedStatement = prepare_cached(session,
             "INSERT INTO borrows_by_user "
             "(user_id, borrow_date, isbn, book_title, status, due_date, return_date) "
             "VALUES (?, ?, ?, ?, ?, ?, ?)"
         )
 
-        self._ins_borrow_book: PreparedStatement = session.prepare(
+        self._ins_borrow_book: PreparedStatement = prepare_cached(session,
             "INSERT INTO borrows_by_book "
             "(isbn, borrow_date, user_id, user_name, status, due_date, return_date, book_title) "
             "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
         )
 
-        self._ins_active: PreparedStatement = session.prepare(
+        self._ins_active: PreparedStatement = prepare_cached(session,
             "INSERT INTO active_borrows_by_user "
             "(user_id, borrow_date, isbn, book_title, due_date) "
             "VALUES (?, ?, ?, ?, ?)"
         )
 
-        self._del_active: PreparedStatement = session.prepare(
-            "DELETE FROM active_borrows_by_user WHERE user_id = ? AND borrow_date = ? AND isbn = ?"
+        self._del_active: PreparedStatement = prepare_cached(session,
+            "DELETE FROM active_borrows_by_user WHERE user_id = ? AND isbn = ? AND borrow_date = ?"
         )
 
-        self._upd_borrow_user_return: PreparedStatement = session.prepare(
+        self._upd_borrow_user_return: PreparedStatement = prepare_cached(session,
             "UPDATE borrows_by_user SET status = ?, return_date = ? "
             "WHERE user_id = ? AND borrow_date = ? AND isbn = ?"
         )
 
-        self._upd_borrow_book_return: PreparedStatement = session.prepare(
+        self._upd_borrow_book_return: PreparedStatement = prepare_cached(session,
             "UPDATE borrows_by_book SET status = ?, return_date = ? "
             "WHERE isbn = ? AND borrow_date = ? AND user_id = ?"
         )
 
-        # Pour retrouver l'emprunt actif du user sur un isbn (sans scan)
-        self._sel_active_by_user: PreparedStatement = session.prepare(
-            "SELECT borrow_date, isbn, book_title, due_date "
+        # Pour retrouver l'emprunt actif du user sur un isbn (sans scan):
+        # clustering (isbn, borrow_date DESC) => lecture directe de la ligne
+        self._sel_active_by_user_isbn: PreparedStatement = prepare_cached(session,
+            "SELECT borrow_date FROM active_borrows_by_user "
+            "WHERE user_id = ? AND isbn = ? LIMIT 1"
+        )
+
+        # Listes par utilisateur (une partition user_id)
+        self._sel_active_by_user: PreparedStatement = prepare_cached(session,
+            "SELECT user_id, borrow_date, isbn, book_title, due_date "
             "FROM active_borrows_by_user WHERE user_id = ?"
         )
 
-    def borrow_book(self, user_id: UUID, isbn: str, loan_days: int = 14) -> BorrowResult:
-        # 1) Lire book
-        book = self.session.execute(self._sel_book, (isbn,)).one()
+        self._sel_history_by_user: PreparedStatement = prepare_cached(session,
+            "SELECT borrow_date, isbn, book_title, status, due_date, return_date "
+            "FROM borrows_by_user WHERE user_id = ?"
+        )
+
+    def _cas_copies(self, book, delta: int) -> Optional[int]:
+        """
+        Applique delta (-1 emprunt / +1 retour) sur books_by_id.available_copies via LWT.
+        En cas de conflit (emprunt concurrent), on repart de la valeur renvoyée par Cassandra.
+        Retourne la nouvelle valeur, ou None s'il n'y a plus de copie à emprunter.
+        """
+        current = book.available_copies
+        total = book.total_copies
+        for _ in range(MAX_CAS_RETRIES):
+            new_avail = (current or 0) + delta
+            if new_avail < 0:
+                return None
+            # Clamp: ne pas dépasser total_copies si présent
+            if total is not None:
+                new_avail = min(new_avail, total)
+
+            rs = self.session.execute(self._cas_book_copies, (new_avail, book.isbn, current))
+            if rs.was_applied:
+                return new_avail
+            current = rs.one().available_copies
+
+        raise RuntimeError(f"available_copies: trop de conflits concurrents sur {book.isbn}")
+
+    @staticmethod
+    def _wait_all(futures: List[Tuple[str, ResponseFuture]]) -> None:
+        """
+        Attend toutes les écritures lancées en execute_async.
+        On attend TOUTES les réponses avant de lever la première erreur (avec le nom de la table).
+        """
+        errors = []
+        for table, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"❌ write failed ({table}): {e}")
+                errors.append((table, e))
+        if errors:
+            table, e = errors[0]
+            raise RuntimeError(f"{table}: {e}") from e
+
+    def get_book_async(self, isbn: str) -> ResponseFuture:
+        """Lecture du livre telle qu'attendue par borrow_book(book_future=...)."""
+        return self.session.execute_async(self._sel_book, (isbn,))
+
+    def borrow_book(self, user_id: UUID, isbn: str, loan_days: int = 14,
+                    book_future: Optional[ResponseFuture] = None) -> BorrowResult:
+        # 1) Lire book + user en parallèle (~1 RTT au lieu de 2).
+        # Si le livre est absent / indisponible, la lecture user est simplement ignorée.
+        # book_future: lecture déjà lancée par l'appelant (get_book_async), ex. pendant qu'il
+        # résout l'email -> user_id.
+        if book_future is None:
+            book_future = self.get_book_async(isbn)
+        user_future = self.session.execute_async(self._sel_user, (user_id,))
+
+        book = book_future.result().one()
         if not book:
             return BorrowResult(False, "Livre introuvable")
 
-        if book.available_copies is None or book.available_copies <= 0:
+        if (book.available_copies or 0) <= 0:
             return BorrowResult(False, "Aucune copie disponible")
 
-        # 2) Lire user
-        user = self.session.execute(self._sel_user, (user_id,)).one()
+        # 2) User
+        user = user_future.result().one()
         if not user:
             return BorrowResult(False, "Utilisateur introuvable")
 
-        user_name = f"{user.first_name} {user.last_name}".strip()
-
-        now = datetime.now(timezone.utc)
-        due = now + timedelta(days=loan_days)
-
         # 3) Ecritures (best effort, pas transaction)
         try:
-            new_avail = int(book.available_copies) - 1
-
-            # Update copies in 3 tables
-            self.session.execute(self._upd_book_copies, (new_avail, isbn))
-            self.session.execute(self._upd_book_cat_copies, (new_avail, book.category, book.title, isbn))
-            self.session.execute(self._upd_book_author_copies, (new_avail, book.author, book.title, isbn))
-
-            # Insert borrow history
-            self.session.execute(self._ins_borrow_user, (user_id, now, isbn, book.title, "BORROWED", due, None))
-            self.session.execute(self._ins_borrow_book, (isbn, now, user_id, user_name, "BORROWED", due, None, book.title))
-
-            # Insert active borrow
-            self.session.execute(self._ins_active, (user_id, now, isbn, book.title, due))
-
-            # Update user counters
-            total_b = int(user.total_borrows or 0) + 1
-            active_b = int(user.active_borrows or 0) + 1
-            self.session.execute(self._upd_user_counts, (total_b, active_b, user_id))
+            # available_copies n'existe que dans books_by_id: le LWT suffit
+            if self._cas_copies(book, -1) is None:
+                return BorrowResult(False, "Aucune copie disponible")
+
+            # Valeurs calculées une seule fois, uniquement sur le chemin d'écriture
+            now = datetime.now(timezone.utc)
+            due = now + timedelta(days=loan_days)
+            title = book.title
+            user_name = f"{user.first_name} {user.last_name}".strip()
+            total_b = (user.total_borrows or 0) + 1
+            active_b = (user.active_borrows or 0) + 1
+
+            # Batch UNLOGGED limité à la clé user_id (même token => mêmes réplicas):
+            # historique + emprunt actif + compteurs. borrows_by_book (clé isbn) part à côté.
+            by_user = BatchStatement(batch_type=BatchType.UNLOGGED)
+            by_user.add(self._ins_borrow_user, (user_id, now, isbn, title, "BORROWED", due, None))
+            by_user.add(self._ins_active, (user_id, now, isbn, title, due))
+            by_user.add(self._upd_user_counts, (total_b, active_b, user_id))
+
+            # Envoi en parallèle, une seule attente
+            self._wait_all([
+                ("borrows_by_user/active_borrows_by_user/users_by_id", self.session.execute_async(by_user)),
+                ("borrows_by_book", self.session.execute_async(self._ins_borrow_book, (
+                    isbn, now, user_id, user_name, "BORROWED", due, None, title
+                ))),
+            ])
 
             logger.success(f"✅ Emprunt OK: {user_id} -> {isbn}")
             return BorrowResult(True, "Emprunt effectué")
@@ -139,53 +203,47 @@ class BorrowRepository:
             return BorrowResult(False, f"Erreur emprunt: {e}")
 
     def return_book(self, user_id: UUID, isbn: str) -> BorrowResult:
-        # 1) Trouver l'emprunt actif correspondant (on lit la partition user_id)
-        active_rows = list(self.session.execute(self._sel_active_by_user, (user_id,)))
-        match = None
-        for r in active_rows:
-            if r.isbn == isbn:
-                match = r
-                break
+        # Les 3 lectures sont indépendantes: envoyées ensemble (~1 RTT au lieu de 3)
+        match_future = self.session.execute_async(self._sel_active_by_user_isbn, (user_id, isbn))
+        book_future = self.get_book_async(isbn)
+        user_future = self.session.execute_async(self._sel_user, (user_id,))
 
+        # 1) Trouver l'emprunt actif correspondant (point read par user_id + isbn)
+        match = match_future.result().one()
         if not match:
             return BorrowResult(False, "Aucun emprunt actif trouvé pour ce livre")
 
         borrow_date = match.borrow_date
 
         # 2) Lire book (pour remettre copies)
-        book = self.session.execute(self._sel_book, (isbn,)).one()
+        book = book_future.result().one()
         if not book:
             return BorrowResult(False, "Livre introuvable (books_by_id)")
 
         # 3) Lire user
-        user = self.session.execute(self._sel_user, (user_id,)).one()
+        user = user_future.result().one()
         if not user:
             return BorrowResult(False, "Utilisateur introuvable")
 
-        now = datetime.now(timezone.utc)
-
         try:
-            new_avail = int(book.available_copies or 0) + 1
-            # Clamp: ne pas dépasser total_copies si présent
-            if book.total_copies is not None:
-                new_avail = min(new_avail, int(book.total_copies))
+            self._cas_copies(book, +1)
 
-            # Update copies in 3 tables
-            self.session.execute(self._upd_book_copies, (new_avail, isbn))
-            self.session.execute(self._upd_book_cat_copies, (new_avail, book.category, book.title, isbn))
-            self.session.execute(self._upd_book_author_copies, (new_avail, book.author, book.title, isbn))
+            now = datetime.now(timezone.utc)
+            total_b = user.total_borrows or 0
+            active_b = max(0, (user.active_borrows or 0) - 1)
 
-            # Update statuses
-            self.session.execute(self._upd_borrow_user_return, ("RETURNED", now, user_id, borrow_date, isbn))
-            self.session.execute(self._upd_borrow_book_return, ("RETURNED", now, isbn, borrow_date, user_id))
+            # Même découpage que borrow_book: un batch pour la clé user_id, borrows_by_book à part
+            by_user = BatchStatement(batch_type=BatchType.UNLOGGED)
+            by_user.add(self._upd_borrow_user_return, ("RETURNED", now, user_id, borrow_date, isbn))
+            by_user.add(self._del_active, (user_id, isbn, borrow_date))
+            by_user.add(self._upd_user_counts, (total_b, active_b, user_id))
 
-            # Remove active borrow
-            self.session.execute(self._del_active, (user_id, borrow_date, isbn))
-
-            # Update user counters
-            total_b = int(user.total_borrows or 0)
-            active_b = max(0, int(user.active_borrows or 0) - 1)
-            self.session.execute(self._upd_user_counts, (total_b, active_b, user_id))
+            self._wait_all([
+                ("borrows_by_user/active_borrows_by_user/users_by_id", self.session.execute_async(by_user)),
+                ("borrows_by_book", self.session.execute_async(self._upd_borrow_book_return, (
+                    "RETURNED", now, isbn, borrow_date, user_id
+                ))),
+            ])
 
             logger.success(f"✅ Retour OK: {user_id} -> {isbn}")
             return BorrowResult(True, "Livre retourné")
@@ -193,10 +251,19 @@ class BorrowRepository:
             logger.error(f"❌ return_book failed: {e}")
             return BorrowResult(False, f"Erreur retour: {e}")
 
-    def get_active_borrows_by_user(self, user_id: UUID) -> List[Dict[str, Any]]:
-        rows = self.session.execute(
-            "SELECT user_id, borrow_date, isbn, book_title, due_date "
-            "FROM active_borrows_by_user WHERE user_id = %s",
-            (user_id,)
-        )
-        return [dict(r._asdict()) for r in rows]
\ No newline at end of file
+    def _execute_paged(self, stmt: PreparedStatement, params: tuple, fetch_size: Optional[int]):
+        bound = stmt.bind(params)
+        if fetch_size:
+            bound.fetch_size = fetch_size
+        return self.session.execute(bound)
+
+    def get_active_borrows_by_user(self, user_id: UUID) -> List[Any]:
+        return list(self.session.execute(self._sel_active_by_user, (user_id,)))
+
+    def iter_active_borrows_by_user(self, user_id: UUID, fetch_size: Optional[int] = None):
+        """Emprunts actifs d'un user, itérés page par page (fetch_size lignes par page)."""
+        return self._execute_paged(self._sel_active_by_user, (user_id,), fetch_size)
+
+    def iter_borrow_history(self, user_id: UUID, fetch_size: Optional[int] = None):
+        """Historique complet (borrows_by_user) d'un user, itéré page par page."""
+        return self._execute_paged(self._sel_history_by_user, (user_id,), fetch_size)
\ No newline at end of file
@@ -1,10 +1,15 @@
+import time
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from functools import lru_cache
+from typing import Optional, Any, List
 from uuid import UUID, uuid4
 from datetime import datetime, timezone
+from cassandra.concurrent import execute_concurrent
 from cassandra.query import PreparedStatement
 from loguru import logger
 
+from config.database import prepare_cached
+
 
 @dataclass
 class User:
@@ -19,35 +24,58 @@ class User:
     active_borrows: int = 0
 
 
+# Durée de vie d'une association email -> user_id en cache. Utile seulement pour un process
+# qui dure (l'app web): une commande CLI ne résout qu'un email puis s'arrête. Un email
+# ré-inscrit depuis un autre process (CLI, seed) est donc pris en compte au plus tard après 60 s.
+USER_ID_CACHE_TTL = 60  # secondes
+
+
+@lru_cache(maxsize=4096)
+def _resolve_user_id(session, stmt: PreparedStatement, email: str, ttl_bucket: int) -> UUID:
+    """
+    email -> user_id, mis en cache par session et par tranche de USER_ID_CACHE_TTL secondes
+    (ttl_bucket change => nouvelle entrée => relecture).
+    Lève LookupError si l'email est inconnu: les absences ne sont donc pas mises en cache.
+    """
+    row = session.execute(stmt, (email,)).one()
+    if not row:
+        raise LookupError(email)
+    return row.user_id
+
+
 class UserRepository:
     def __init__(self, session):
         self.session = session
 
-        self._ins: PreparedStatement = session.prepare("""
+        self._ins: PreparedStatement = prepare_cached(session, """
             INSERT INTO users_by_id (
               user_id, email, first_name, last_name, phone, address,
               registration_date, total_borrows, active_borrows
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         """)
 
-        self._sel: PreparedStatement = session.prepare("""
+        self._sel: PreparedStatement = prepare_cached(session, """
             SELECT * FROM users_by_id WHERE user_id = ?
         """)
 
-        self._upd_counts: PreparedStatement = session.prepare("""
+        self._upd_counts: PreparedStatement = prepare_cached(session, """
             UPDATE users_by_id
             SET total_borrows = ?, active_borrows = ?
             WHERE user_id = ?
         """)
 
-        self._insert_user_by_email = session.prepare("""
+        self._insert_user_by_email = prepare_cached(session, """
             INSERT INTO users_by_email (email, user_id, first_name, last_name, registration_date)
             VALUES (?, ?, ?, ?, ?)
         """)
 
+        self._sel_id_by_email: PreparedStatement = prepare_cached(session, """
+            SELECT user_id FROM users_by_email WHERE email = ?
+        """)
+
 
     def create_user(self, email: str, first_name: str, last_name: str,
-                    phone: str = "", address: str = ""):
+                    phone: str = "", address: str = "") -> UUID:
         user_id = uuid4()
         registration_date = datetime.now(timezone.utc)
 
@@ -59,6 +87,7 @@ class UserRepository:
             self.session.execute(self._insert_user_by_email, (
                 email, user_id, first_name, last_name, registration_date
             ))
+            _resolve_user_id.cache_clear()
 
             logger.success(f"✅ Utilisateur créé: {user_id}")
             return user_id
@@ -66,17 +95,54 @@ class UserRepository:
             logger.error(f"❌ create_user failed: {e}")
             raise
 
-    def get_user(self, user_id: UUID) -> Optional[Dict[str, Any]]:
-        row = self.session.execute(self._sel, (user_id,)).one()
-        return dict(row._asdict()) if row else None
+    def create_users(self, users: List[User], concurrency: int = 100) -> List[Optional[UUID]]:
+        """
+        Import en masse (users_by_id + users_by_email), jusqu'à `concurrency` requêtes en vol.
+        Retourne le user_id de chaque utilisateur créé, ou None en cas d'échec (dans l'ordre).
+        """
+        now = datetime.now(timezone.utc)
+        statements = []
+        for u in users:
+            registration_date = u.registration_date or now
+            statements.append((self._ins, (
+                u.user_id, u.email, u.first_name, u.last_name, u.phone, u.address,
+                registration_date, u.total_borrows, u.active_borrows
+            )))
+            statements.append((self._insert_user_by_email, (
+                u.email, u.user_id, u.first_name, u.last_name, registration_date
+            )))
+
+        results = execute_concurrent(
+            self.session, statements, concurrency=concurrency, raise_on_first_error=False
+        )
+        _resolve_user_id.cache_clear()
+
+        user_ids: List[Optional[UUID]] = [u.user_id for u in users]
+        for i, (success, result) in enumerate(results):
+            if not success:
+                logger.error(f"❌ create_users failed ({users[i // 2].email}): {result}")
+                user_ids[i // 2] = None
+
+        logger.success(f"✅ Utilisateurs créés: {sum(1 for u in user_ids if u)}/{len(users)}")
+        return user_ids
+
+    def get_user(self, user_id: UUID) -> Optional[Any]:
+        return self.session.execute(self._sel, (user_id,)).one()
 
     def set_counts(self, user_id: UUID, total_borrows: int, active_borrows: int) -> None:
         self.session.execute(self._upd_counts, (total_borrows, active_borrows, user_id))
 
-    def get_user_id_by_email(self, email: str):
-        row = self.session.execute(
-            "SELECT user_id FROM users_by_email WHERE email=%s",
-            (email,)
-        ).one()
-        return row.user_id if row else None
+    def get_user_id_by_email(self, email: str) -> Optional[UUID]:
+        # users_by_email.user_id est un uuid: le driver renvoie déjà un uuid.UUID
+        try:
+            return _resolve_user_id(
+                self.session, self._sel_id_by_email, email, int(time.monotonic() // USER_ID_CACHE_TTL)
+            )
+        except LookupError:
+            return None
+
+    @staticmethod
+    def forget_user_ids() -> None:
+        """Vide le cache email -> user_id (ex. user_id résolu mais introuvable dans users_by_id)."""
+        _resolve_user_id.cache_clear()
 
@@ -16,10 +16,13 @@
 
 from __future__ import annotations
 
+import mmap
 import os
 import re
+from itertools import chain
 from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 
 from reportlab.lib import colors
@@ -61,9 +64,11 @@ class TableInfo:
 # Helpers: schema parsing
 # ----------------------------
 
+# Seulement l'en-tête "CREATE TABLE nom (": le corps est ensuite lu par _scan_table_body.
+# Motif bytes: appliqué directement sur le fichier mappé en mémoire (mmap), sans copie en str.
 CREATE_TABLE_RE = re.compile(
-    r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(?P<name>[a-zA-Z0-9_.\"]+)\s*\((?P<body>.*?)\)\s*;",
-    re.IGNORECASE | re.DOTALL,
+    rb"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(?P<name>[a-zA-Z0-9_.\"]+)\s*\(",
+    re.IGNORECASE,
 )
 
 PRIMARY_KEY_RE = re.compile(
@@ -80,24 +85,50 @@ def _clean_ident(s: str) -> str:
         return s.split(".")[-1]
     return s
 
-def _split_top_level_commas(s: str) -> List[str]:
-    """Split by commas but respect parentheses nesting."""
-    parts = []
-    buf = []
-    depth = 0
-    for ch in s:
-        if ch == "(":
-            depth += 1
-        elif ch == ")":
-            depth = max(0, depth - 1)
-        if ch == "," and depth == 0:
-            parts.append("".join(buf).strip())
-            buf = []
-        else:
-            buf.append(ch)
-    if buf:
-        parts.append("".join(buf).strip())
-    return [p for p in parts if p]
+# Seuls les caractères structurants sont visités (via le moteur regex, pas une boucle Python par caractère)
+SPLIT_RE = re.compile(r"[(),]")
+SPLIT_BYTES_RE = re.compile(rb"[(),]")
+
+def _split_top_level_commas(s: str, clean: bool = False) -> List[str]:
+    """
+    Split by commas but respect parentheses nesting.
+    clean=True: chaque morceau est aussi nettoyé comme par _clean_ident (guillemets, keyspace.)
+    dans la même passe.
+    """
+    if "(" not in s and ")" not in s:
+        # Cas le plus fréquent (colonnes sans type imbriqué, clés de clustering): split natif
+        parts = [x.strip() for x in s.split(",")]
+    else:
+        parts = []
+        start = 0
+        depth = 0
+        for m in SPLIT_RE.finditer(s):
+            ch = m.group()
+            if ch == "(":
+                depth += 1
+            elif ch == ")":
+                depth = max(0, depth - 1)
+            elif depth == 0:
+                parts.append(s[start:m.start()].strip())
+                start = m.end()
+        parts.append(s[start:].strip())
+
+    if not clean:
+        return [p for p in parts if p]
+
+    idents = []
+    for p in parts:
+        if not p:
+            continue
+        if p[0] == "(":
+            pass  # groupe composite "(a, b)": nettoyé au niveau suivant
+        elif p[0] == '"' and p[-1] == '"':
+            p = p[1:-1]
+        elif "." in p:
+            # keyspace.table -> table
+            p = p.rsplit(".", 1)[1]
+        idents.append(p)
+    return idents
 
 def _parse_primary_key(pk_expr: str) -> Tuple[List[str], List[str]]:
     """
@@ -109,56 +140,102 @@ def _parse_primary_key(pk_expr: str) -> Tuple[List[str], List[str]]:
     pk_expr = pk_expr.strip()
     # remove surrounding parentheses if any
     # pk_expr is inside "PRIMARY KEY ( ... )" already extracted without outermost
-    items = _split_top_level_commas(pk_expr)
+    # Identifiants déjà nettoyés par le split (un "(a, b)" composite n'est pas modifié)
+    items = _split_top_level_commas(pk_expr, clean=True)
     if not items:
         return [], []
 
-    first = items[0].strip()
+    first = items[0]
     part_keys: List[str] = []
-    clust_keys: List[str] = []
+    clust_keys: List[str] = items[1:]
 
     if first.startswith("(") and first.endswith(")"):
         inside = first[1:-1].strip()
         # Could be "(a,b)" or "(a)"
-        part_keys = [_clean_ident(x) for x in _split_top_level_commas(inside)]
-        clust_keys = [_clean_ident(x) for x in items[1:]]
+        part_keys = _split_top_level_commas(inside, clean=True)
     else:
         # single partition key
-        part_keys = [_clean_ident(first)]
-        clust_keys = [_clean_ident(x) for x in items[1:]]
+        part_keys = [first]
 
     return part_keys, clust_keys
 
+def _scan_table_body(content: bytes, start: int) -> Tuple[List[str], int]:
+    """
+    Une seule passe depuis la "(" ouvrante du CREATE TABLE: suit la profondeur des parenthèses,
+    découpe sur les virgules de premier niveau et s'arrête sur la ")" fermante correspondante
+    (les options WITH ... qui suivent ne font donc jamais partie du corps).
+    Seuls les segments retenus sont décodés en str.
+    Retourne (segments, position après la parenthèse fermante).
+    """
+    segments: List[str] = []
+    seg_start = start
+    depth = 1
+    for m in SPLIT_BYTES_RE.finditer(content, start):
+        ch = m.group()
+        if ch == b"(":
+            depth += 1
+        elif ch == b")":
+            depth -= 1
+            if depth == 0:
+                segments.append(content[seg_start:m.start()].decode("utf-8"))
+                return segments, m.end()
+        elif depth == 1:
+            segments.append(content[seg_start:m.start()].decode("utf-8"))
+            seg_start = m.end()
+    # Parenthèse non fermée: on garde ce qui a été lu
+    segments.append(content[seg_start:].decode("utf-8"))
+    return segments, len(content)
+
 def parse_schema_cql(schema_path: str) -> List[TableInfo]:
-    if not os.path.exists(schema_path):
+    try:
+        f = open(schema_path, "rb")
+    except FileNotFoundError:
         return []
 
-    with open(schema_path, "r", encoding="utf-8") as f:
-        content = f.read()
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []  # mmap refuse un fichier vide
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            tables = _parse_tables(content)
+
+    # Stable order
+    tables.sort(key=lambda t: t.name.lower())
+    return tables
 
+def _parse_tables(content: bytes) -> List[TableInfo]:
     tables: List[TableInfo] = []
 
-    for m in CREATE_TABLE_RE.finditer(content):
-        tname = _clean_ident(m.group("name"))
-        body = m.group("body")
+    pos = 0
+    while True:
+        m = CREATE_TABLE_RE.search(content, pos)
+        if not m:
+            break
+        tname = _clean_ident(m.group("name").decode("utf-8"))
 
         # lines/segments inside table definition separated by top-level commas
-        segments = _split_top_level_commas(body)
+        segments, pos = _scan_table_body(content, m.end())
 
         raw_pk_line = ""
         columns: List[str] = []
 
         for seg in segments:
-            seg_clean = seg.strip().rstrip()
-            pk_m = PRIMARY_KEY_RE.search(seg_clean)
-            if pk_m:
-                raw_pk_line = pk_m.group("pk").strip()
-            else:
-                # column definition (best effort): ignore WITH options here (should not be inside body)
-                # Example: "user_id uuid" or "borrow_date timestamp"
-                col = " ".join(seg_clean.split())
-                if col:
-                    columns.append(col)
+            seg_clean = " ".join(seg.split())
+            if not seg_clean:
+                continue
+            up = seg_clean.upper()
+            # Pré-filtre O(1): seul le segment "PRIMARY KEY (...)" passe par la regex
+            if up.startswith("PRIMARY KEY"):
+                pk_m = PRIMARY_KEY_RE.search(seg_clean)
+                if pk_m:
+                    raw_pk_line = pk_m.group("pk").strip()
+                continue
+
+            # column definition (best effort)
+            # Example: "user_id uuid" or "borrow_date timestamp"
+            columns.append(seg_clean)
+            # Clé primaire déclarée sur la colonne: "isbn text PRIMARY KEY"
+            if not raw_pk_line and up.endswith("PRIMARY KEY"):
+                raw_pk_line = seg_clean.split()[0]
 
         part_keys, clust_keys = ([], [])
         if raw_pk_line:
@@ -174,10 +251,27 @@ def parse_schema_cql(schema_path: str) -> List[TableInfo]:
             )
         )
 
-    # Stable order
-    tables.sort(key=lambda t: t.name.lower())
     return tables
 
+@lru_cache(maxsize=8)
+def _parse_schema_cached(schema_path: str, mtime: float) -> Tuple[TableInfo, ...]:
+    """
+    parse_schema_cql mémorisé par (chemin, mtime): build_report appelé en boucle (lib, tests)
+    ne re-scanne pas le fichier tant qu'il n'a pas changé. Tuple => valeur de cache non modifiable.
+    """
+    return tuple(parse_schema_cql(schema_path))
+
+def load_schema(schema_path: str) -> Tuple[bool, List[TableInfo]]:
+    """
+    (schema trouvé ?, tables) avec un seul stat: sert à la fois pour la page de garde
+    et pour la clé de cache (mtime) de _parse_schema_cached.
+    """
+    try:
+        mtime = os.stat(schema_path).st_mtime
+    except FileNotFoundError:
+        return False, []
+    return True, list(_parse_schema_cached(schema_path, mtime))
+
 
 # ----------------------------
 # Helpers: styling & layout
@@ -196,20 +290,26 @@ def try_register_fonts():
         ("Inter", "Inter-Regular.ttf"),
         ("Inter-Bold", "Inter-Bold.ttf"),
     ]
+    # Un seul parcours du dossier au lieu d'un stat par police candidate
+    with os.scandir(fonts_dir) as entries:
+        present = {e.name for e in entries}
     for name, file in candidates:
-        path = os.path.join(fonts_dir, file)
-        if os.path.exists(path):
-            pdfmetrics.registerFont(TTFont(name, path))
+        if file in present:
+            pdfmetrics.registerFont(TTFont(name, os.path.join(fonts_dir, file)))
 
+@lru_cache(maxsize=1)
 def build_styles():
+    # Mémorisé: la feuille de styles n'est plus modifiée une fois construite,
+    # les builds suivants dans le même process la réutilisent.
     styles = getSampleStyleSheet()
 
     base_font = "Helvetica"
     bold_font = "Helvetica-Bold"
     # If you registered "Inter", switch automatically
-    if "Inter" in pdfmetrics.getRegisteredFontNames():
+    registered = set(pdfmetrics.getRegisteredFontNames())
+    if "Inter" in registered:
         base_font = "Inter"
-    if "Inter-Bold" in pdfmetrics.getRegisteredFontNames():
+    if "Inter-Bold" in registered:
         bold_font = "Inter-Bold"
 
     styles.add(
@@ -278,23 +378,59 @@ def build_styles():
     return styles, base_font, bold_font
 
 
+# TableStyle construits une seule fois à l'import et partagés par tous les tableaux
+# (setStyle ne fait que lire les commandes du style).
+_KV_STYLE = TableStyle(
+    [
+        ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+        ("FONTSIZE", (0, 0), (-1, -1), 9.5),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ("TEXTCOLOR", (0, 0), (0, -1), colors.HexColor("#222222")),
+        ("TEXTCOLOR", (1, 0), (1, -1), colors.HexColor("#222222")),
+        ("BACKGROUND", (0, 0), (-1, -1), colors.white),
+        ("LINEBELOW", (0, 0), (-1, -1), 0.25, colors.HexColor("#DDDDDD")),
+        ("TOPPADDING", (0, 0), (-1, -1), 6),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
+    ]
+)
+
+_SUMMARY_STYLE = TableStyle(
+    [
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#0F172A")),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, 0), 10),
+        ("ALIGN", (0, 0), (-1, 0), "LEFT"),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.HexColor("#E5E7EB")),
+        ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
+        ("FONTSIZE", (0, 1), (-1, -1), 9),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#F8FAFC")]),
+        ("TOPPADDING", (0, 0), (-1, -1), 6),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
+    ]
+)
+
+_COMP_STYLE = TableStyle(
+    [
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#0F172A")),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, 0), 10),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.HexColor("#E5E7EB")),
+        ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
+        ("FONTSIZE", (0, 1), (-1, -1), 9),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#F8FAFC")]),
+        ("TOPPADDING", (0, 0), (-1, -1), 6),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
+    ]
+)
+
+
 def make_kv_table(rows: List[Tuple[str, str]]) -> Table:
     t = Table(rows, colWidths=[55 * mm, 125 * mm])
-    t.setStyle(
-        TableStyle(
-            [
-                ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
-                ("FONTSIZE", (0, 0), (-1, -1), 9.5),
-                ("VALIGN", (0, 0), (-1, -1), "TOP"),
-                ("TEXTCOLOR", (0, 0), (0, -1), colors.HexColor("#222222")),
-                ("TEXTCOLOR", (1, 0), (1, -1), colors.HexColor("#222222")),
-                ("BACKGROUND", (0, 0), (-1, -1), colors.white),
-                ("LINEBELOW", (0, 0), (-1, -1), 0.25, colors.HexColor("#DDDDDD")),
-                ("TOPPADDING", (0, 0), (-1, -1), 6),
-                ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
-            ]
-        )
-    )
+    t.setStyle(_KV_STYLE)
     return t
 
 
@@ -306,24 +442,7 @@ def make_tables_summary_table(tables: List[TableInfo]) -> Table:
         data.append([t.name, pk, ck])
 
     tbl = Table(data, colWidths=[55 * mm, 70 * mm, 55 * mm])
-    tbl.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#0F172A")),
-                ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                ("FONTSIZE", (0, 0), (-1, 0), 10),
-                ("ALIGN", (0, 0), (-1, 0), "LEFT"),
-                ("GRID", (0, 0), (-1, -1), 0.25, colors.HexColor("#E5E7EB")),
-                ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
-                ("FONTSIZE", (0, 1), (-1, -1), 9),
-                ("VALIGN", (0, 0), (-1, -1), "TOP"),
-                ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#F8FAFC")]),
-                ("TOPPADDING", (0, 0), (-1, -1), 6),
-                ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
-            ]
-        )
-    )
+    tbl.setStyle(_SUMMARY_STYLE)
     return tbl
 
 
@@ -331,9 +450,12 @@ def make_tables_summary_table(tables: List[TableInfo]) -> Table:
 # Architecture diagram (vector)
 # ----------------------------
 
+@lru_cache(maxsize=1)
 def architecture_diagram() -> Drawing:
     """
     Schéma simple et propre, vectoriel (pas d'image externe).
+    Construit une seule fois par process: le Drawing n'est jamais modifié après coup,
+    il peut donc être réutilisé tel quel d'un build_report à l'autre.
     """
     w = 180 * mm
     h = 85 * mm
@@ -416,34 +538,13 @@ def add_header_footer(canvas, doc, title: str):
 
 
 # ----------------------------
-# Main PDF builder
+# Report sections
 # ----------------------------
+# Une fonction par section: chacune renvoie ses flowables, build_report se contente de les enchaîner.
 
-def build_report(
-    out_pdf_path: str = os.path.join("report", "rapport_analyse.pdf"),
-    schema_path: str = os.path.join("schema", "schema.cql"),
-):
-    os.makedirs(os.path.dirname(out_pdf_path), exist_ok=True)
-
-    try_register_fonts()
-    styles, base_font, bold_font = build_styles()
-
-    tables = parse_schema_cql(schema_path)
-
-    doc = SimpleDocTemplate(
-        out_pdf_path,
-        pagesize=A4,
-        leftMargin=18 * mm,
-        rightMargin=18 * mm,
-        topMargin=22 * mm,
-        bottomMargin=18 * mm,
-        title="Rapport d'Analyse - Systeme de Gestion de Bibliotheque Numerique",
-        author="Projet Library System",
-    )
-
+def _cover(styles, schema_found: bool) -> List:
+    """Page de garde: objectif, périmètre, diagramme d'architecture."""
     story: List = []
-
-    # --- Cover
     story.append(Paragraph("Rapport d'Analyse", styles["TitleX"]))
 
     story.append(Spacer(1, 12))
@@ -461,7 +562,7 @@ def build_report(
                 ("Objectif", "Documenter la modelisation Cassandra, justifier les cles (partition/clustering), "
                             "expliquer les compromis coherence/disponibilite, et comparer a une approche SQL."),
                 ("Perimetre", "Livres, utilisateurs, emprunts, emprunts actifs, historiques et tables de navigation (denormalisation)."),
-                ("Source de verite", f"schema.cql: {'trouve' if os.path.exists(schema_path) else 'absent'}"),
+                ("Source de verite", f"schema.cql: {'trouve' if schema_found else 'absent'}"),
             ]
         )
     )
@@ -476,7 +577,12 @@ def build_report(
     ))
     story.append(PageBreak())
 
-    # --- Section: Data model & query patterns
+    return story
+
+
+def _model_section(styles, tables: List[TableInfo]) -> List:
+    """1. Modélisation orientée requêtes + résumé des tables."""
+    story: List = []
     story.append(Paragraph("1. Modelisation Cassandra (oriente requetes)", styles["H1"]))
     story.append(Paragraph(
         "Cassandra impose une modelisation par patterns de requetes: une table par besoin de lecture/tri, "
@@ -506,7 +612,12 @@ def build_report(
     ))
     story.append(PageBreak())
 
-    # --- Section: PK/CK justification (auto + narrative)
+    return story
+
+
+def _keys_section(styles, tables: List[TableInfo]) -> List:
+    """2. Partition / clustering keys, une fiche par table."""
+    story: List = []
     story.append(Paragraph("2. Justification des Partition Keys et Clustering Keys", styles["H1"]))
     story.append(Paragraph(
         "Cette section est generee a partir de schema.cql. Pour chaque table, on rappelle la cle primaire et "
@@ -545,7 +656,12 @@ def build_report(
 
     story.append(PageBreak())
 
-    # --- Consistency vs Availability
+    return story
+
+
+def _consistency_section(styles) -> List:
+    """3. Cohérence vs disponibilité."""
+    story: List = []
     story.append(Paragraph("3. Coherence vs Disponibilite (CAP) et niveaux de consistency", styles["H1"]))
     story.append(Paragraph(
         "Cassandra privilegie la disponibilite et la tolerance aux partitions. La coherence est ajustable par requete "
@@ -570,7 +686,12 @@ def build_report(
     ))
     story.append(PageBreak())
 
-    # --- SQL comparison
+    return story
+
+
+def _sql_section(styles) -> List:
+    """4. Comparaison SQL."""
+    story: List = []
     story.append(Paragraph("4. Comparaison avec une approche SQL", styles["H1"]))
     story.append(Paragraph(
         "SQL normalise les donnees et repose sur joins et transactions ACID. Cassandra evite joins/subqueries et "
@@ -589,28 +710,17 @@ def build_report(
         ],
         colWidths=[35 * mm, 70 * mm, 70 * mm],
     )
-    comp.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#0F172A")),
-                ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                ("FONTSIZE", (0, 0), (-1, 0), 10),
-                ("GRID", (0, 0), (-1, -1), 0.25, colors.HexColor("#E5E7EB")),
-                ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
-                ("FONTSIZE", (0, 1), (-1, -1), 9),
-                ("VALIGN", (0, 0), (-1, -1), "TOP"),
-                ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#F8FAFC")]),
-                ("TOPPADDING", (0, 0), (-1, -1), 6),
-                ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
-            ]
-        )
-    )
+    comp.setStyle(_COMP_STYLE)
     story.append(comp)
 
     story.append(PageBreak())
 
-    # --- Performance tests (optional)
+    return story
+
+
+def _perf_section(styles) -> List:
+    """5. Tests de performance (gabarit)."""
+    story: List = []
     story.append(Paragraph("5. Tests de performance (optionnel)", styles["H1"]))
     story.append(Paragraph(
         "Cette section est un gabarit: tu peux ajouter des mesures (latence moyenne, throughput) "
@@ -633,6 +743,44 @@ def build_report(
         styles["SmallX"],
     ))
 
+    return story
+
+
+# ----------------------------
+# Main PDF builder
+# ----------------------------
+
+def build_report(
+    out_pdf_path: str = os.path.join("report", "rapport_analyse.pdf"),
+    schema_path: str = os.path.join("schema", "schema.cql"),
+):
+    os.makedirs(os.path.dirname(out_pdf_path), exist_ok=True)
+
+    try_register_fonts()
+    styles, base_font, bold_font = build_styles()
+
+    schema_found, tables = load_schema(schema_path)
+
+    doc = SimpleDocTemplate(
+        out_pdf_path,
+        pagesize=A4,
+        leftMargin=18 * mm,
+        rightMargin=18 * mm,
+        topMargin=22 * mm,
+        bottomMargin=18 * mm,
+        title="Rapport d'Analyse - Systeme de Gestion de Bibliotheque Numerique",
+        author="Projet Library System",
+    )
+
+    story = list(chain(
+        _cover(styles, schema_found),
+        _model_section(styles, tables),
+        _keys_section(styles, tables),
+        _consistency_section(styles),
+        _sql_section(styles),
+        _perf_section(styles),
+    ))
+
     # Build with header/footer
     title = "Rapport d'Analyse - Library System"
     doc.build(
@@ -1,19 +1,39 @@
 # scripts/generate_data.py
 from __future__ import annotations
 
-from random import choice, randint, sample
-from uuid import UUID
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from random import choice, choices, randint, randrange
+from uuid import UUID, uuid4
 from faker import Faker
 from loguru import logger
 
 from config.database import CassandraConnection
 from models.book import BookRepository, Book
-from models.user import UserRepository
+from models.user import UserRepository, User
 from models.borrow import BorrowRepository
 
 
 fake = Faker("fr_FR")
 
+# Nombre d'INSERT en vol pendant les imports en masse (execute_concurrent)
+CONCURRENCY = 64
+
+# Emprunts traités en parallèle (borrow_book est bloquant; la Session du driver est thread-safe)
+BORROW_WORKERS = 8
+
+
+def random_isbn() -> str:
+    """
+    ISBN factice 978-a-bbbbbb-cc-d à partir d'un seul tirage (au lieu de 4 randint):
+    randrange uniforme sur les 10 * 900000 * 90 * 10 combinaisons, décodé champ par champ
+    avec divmod. Chaque champ est exactement uniforme (pas de biais de modulo).
+    """
+    r, a = divmod(randrange(10 * 900000 * 90 * 10), 10)
+    r, b = divmod(r, 900000)
+    d, c = divmod(r, 90)
+    return f"978-{a}-{b + 100000}-{c + 10}-{d}"
+
 
 def generate_books(book_repo: BookRepository, n: int = 100) -> list[str]:
     categories = [
@@ -22,20 +42,25 @@ def generate_books(book_repo: BookRepository, n: int = 100) -> list[str]:
     ]
     publishers = ["Gallimard", "Flammarion", "Hachette", "Albin Michel", "Seuil", "Actes Sud"]
 
-    isbns: list[str] = []
+    books: list[Book] = []
+
+    # Liaisons locales: évite la résolution d'attribut / le dispatch des providers Faker à chaque ligne
+    _sentence, _name, _text = fake.sentence, fake.name, fake.text
+    _choice, _randint = choice, randint
 
     logger.info(f"📚 Génération de {n} livres...")
-    for i in range(n):
-        isbn = f"978-{randint(0,9)}-{randint(100000,999999)}-{randint(10,99)}-{randint(0,9)}"
-        title = fake.sentence(nb_words=4).rstrip(".")
-        author = fake.name()
-        category = choice(categories)
-        publisher = choice(publishers)
-        year = randint(1950, 2025)
-        total = randint(1, 5)
-        desc = fake.text(max_nb_chars=180)
-
-        book = Book(
+    _isbn = random_isbn
+    isbns = [_isbn() for _ in range(n)]
+    for isbn in isbns:
+        title = _sentence(nb_words=4).rstrip(".")
+        author = _name()
+        category = _choice(categories)
+        publisher = _choice(publishers)
+        year = _randint(1950, 2025)
+        total = _randint(1, 5)
+        desc = _text(max_nb_chars=180)
+
+        books.append(Book(
             isbn=isbn,
             title=title,
             author=author,
@@ -45,14 +70,11 @@ def generate_books(book_repo: BookRepository, n: int = 100) -> list[str]:
             total_copies=total,
             available_copies=total,   # on démarre avec toutes les copies dispo
             description=desc
-        )
-
-        ok = book_repo.add_book(book)
-        if ok:
-            isbns.append(isbn)
+        ))
 
-        if (i + 1) % 20 == 0:
-            logger.info(f"  ✅ {i+1}/{n} livres générés")
+    # Payloads construits d'abord, puis envoyés en une fenêtre de CONCURRENCY requêtes en vol
+    ok = book_repo.add_books(books, concurrency=CONCURRENCY)
+    isbns = [b.isbn for b, success in zip(books, ok) if success]
 
     logger.success(f"✅ Livres générés: {len(isbns)}")
     return isbns
@@ -60,26 +82,31 @@ def generate_books(book_repo: BookRepository, n: int = 100) -> list[str]:
 
 def generate_users(user_repo: UserRepository, n: int = 50) -> list[UUID]:
     logger.info(f"👤 Génération de {n} utilisateurs...")
-    user_ids: list[UUID] = []
-
-    for i in range(n):
-        email = fake.unique.email()
-        first = fake.first_name()
-        last = fake.last_name().upper()
-        phone = fake.phone_number()
-        address = fake.address().replace("\n", ", ")
-
-        user_id = user_repo.create_user(
+    users: list[User] = []
+
+    _first_name, _last_name = fake.first_name, fake.last_name
+    _phone_number, _address = fake.phone_number, fake.address
+
+    for _ in range(n):
+        user_id = uuid4()
+        # email = clé de partition de users_by_email: dérivé du user_id => unique (y compris
+        # d'une exécution à l'autre) sans l'ensemble de valeurs déjà vues de fake.unique
+        email = f"user.{user_id.hex[:12]}@example.test"
+        first = _first_name()
+        last = _last_name().upper()
+        phone = _phone_number()
+        address = _address().replace("\n", ", ")
+
+        users.append(User(
+            user_id=user_id,
             email=email,
             first_name=first,
             last_name=last,
             phone=phone,
-            address=address
-        )
-        user_ids.append(user_id)
+            address=address,
+        ))
 
-        if (i + 1) % 10 == 0:
-            logger.info(f"  ✅ {i+1}/{n} utilisateurs générés")
+    user_ids = [u for u in user_repo.create_users(users, concurrency=CONCURRENCY) if u]
 
     logger.success(f"✅ Utilisateurs générés: {len(user_ids)}")
     return user_ids
@@ -95,6 +122,9 @@ def generate_borrows(
     """
     Génère des emprunts en appelant BorrowRepository.borrow_book()
     => cohérent avec ta logique (copies + tables borrows + active_borrows + compteurs users).
+    Parallèle entre utilisateurs (BORROW_WORKERS threads), séquentiel pour un même utilisateur:
+    les compteurs users_by_id sont en lecture-puis-écriture (sans LWT), deux emprunts simultanés
+    du même user perdraient un incrément. Les copies, elles, sont protégées par LWT.
     """
     if not user_ids or not isbns:
         logger.warning("⚠️ Impossible de générer des emprunts: pas de users ou pas de livres.")
@@ -102,15 +132,27 @@ def generate_borrows(
 
     logger.info(f"📦 Génération de {n} emprunts...")
 
-    for i in range(n):
-        user_id = choice(user_ids)
-        isbn = choice(isbns)
+    # Tous les tirages (user, livre) en deux appels C, avant la boucle d'écriture
+    pairs = zip(choices(user_ids, k=n), choices(isbns, k=n))
+
+    by_user: dict[UUID, list[str]] = defaultdict(list)
+    for user_id, isbn in pairs:
+        by_user[user_id].append(isbn)
+
+    def borrow_all(user_id: UUID, user_isbns: list[str]):
+        return [borrow_repo.borrow_book(user_id, isbn, loan_days=loan_days) for isbn in user_isbns]
 
-        res = borrow_repo.borrow_book(user_id, isbn, loan_days=loan_days)
-        if (i + 1) % 10 == 0:
-            logger.info(f"  ▶ {i+1}/{n} emprunts tentés (dernier: {res.ok} - {res.message})")
+    done = ok = 0
+    with ThreadPoolExecutor(max_workers=BORROW_WORKERS) as executor:
+        futures = [executor.submit(borrow_all, user_id, user_isbns) for user_id, user_isbns in by_user.items()]
+        for future in as_completed(futures):
+            results = future.result()
+            previous, done = done, done + len(results)
+            ok += sum(1 for res in results if res.ok)
+            if done // 10 > previous // 10:
+                logger.info(f"  ▶ {done}/{n} emprunts tentés (dernier: {results[-1].ok} - {results[-1].message})")
 
-    logger.success("✅ Emprunts générés (best effort).")
+    logger.success(f"✅ Emprunts générés (best effort): {ok}/{n}")
 
 
 def main():
@@ -1,13 +1,81 @@
+import re
 from pathlib import Path
 from loguru import logger
 from config.database import CassandraConnection
 
+# Seuls les CREATE TABLE consécutifs partent en parallèle; tout le reste (keyspace, USE, index,
+# ALTER, DROP, INSERT...) est exécuté seul, dans l'ordre du fichier
+CONCURRENT_PREFIX = "CREATE TABLE"
+
+# Commentaires (--, //, /* */), chaînes ('...' / "...") et séparateurs ";":
+# un ";" dans un commentaire ou une chaîne ne coupe pas le statement
+CQL_TOKEN_RE = re.compile(
+    rb"--[^\n]*|//[^\n]*|/\*.*?\*/|'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|;",
+    re.DOTALL,
+)
+
+
+def _iter_cql(cql: bytes):
+    """
+    Statements du fichier, en une passe: les commentaires qui précèdent un statement sont sautés,
+    les segments vides ou ne contenant que des commentaires ne sont jamais émis.
+    """
+    start = None  # début du code du statement courant (None tant qu'on n'a vu que des commentaires)
+    pos = 0
+    for m in CQL_TOKEN_RE.finditer(cql):
+        if start is None:
+            gap = cql[pos:m.start()]
+            if gap.strip():
+                start = pos + (len(gap) - len(gap.lstrip()))
+            elif m.group()[:1] in (b"'", b'"'):
+                start = m.start()
+        pos = m.end()
+        if m.group() == b";":
+            if start is not None:
+                yield cql[start:m.start()].strip().decode("utf-8")
+            start = None
+    if start is None and cql[pos:].strip():
+        start = pos
+    if start is not None:
+        yield cql[start:].strip().decode("utf-8")
+
+
+def _statement_head(stmt: str) -> str:
+    """Deux premiers mots du statement, en majuscules (les commentaires de tête sont déjà retirés)."""
+    return " ".join(stmt.split(None, 2)[:2]).upper()
+
+
+def _execute_all(session, stmts):
+    # Envoi en parallèle puis une seule attente: ~1 RTT pour tout le lot au lieu d'1 RTT par DDL
+    futures = [session.execute_async(stmt) for stmt in stmts]
+    for future in futures:
+        future.result()
+    # Tous les nœuds doivent voir les nouvelles tables avant le statement suivant
+    session.cluster.control_connection.wait_for_schema_agreement()
+
+
 def run_cql_file(session, path: str):
-    cql = Path(path).read_text(encoding="utf-8")
-    for stmt in cql.split(";"):
-        stmt = stmt.strip()
-        if stmt:
-            session.execute(stmt)
+    """
+    Exécute le fichier dans l'ordre. Les CREATE TABLE qui se suivent sont indépendants entre eux
+    et partent ensemble (execute_async), puis on attend l'accord de schéma entre nœuds. Les autres
+    statements restent séquentiels: du DDL concurrent envoyé à plusieurs coordinateurs peut
+    laisser les nœuds en désaccord de schéma (keyspace, index, ALTER, DROP...).
+    """
+    # Lecture brute en bytes: seuls les statements non vides sont décodés
+    cql = Path(path).read_bytes()
+
+    tables = []
+    for stmt in _iter_cql(cql):
+        if _statement_head(stmt) == CONCURRENT_PREFIX:
+            tables.append(stmt)
+            continue
+        if tables:
+            _execute_all(session, tables)
+            tables = []
+        # execute() synchrone: le driver attend déjà l'accord de schéma après un DDL
+        session.execute(stmt)
+    if tables:
+        _execute_all(session, tables)
 
 if __name__ == "__main__":
     db = CassandraConnection(keyspace="system")
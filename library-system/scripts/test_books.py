@@ -2,27 +2,28 @@ from config.database import CassandraConnection
 from models.book import BookRepository, Book
 
 if __name__ == "__main__":
-    db = CassandraConnection()
-    session = db.connect()
+    with CassandraConnection() as session:
+        repo = BookRepository(session)
 
-    repo = BookRepository(session)
+        dune = Book(
+            isbn="978-0-123456-78-9",
+            title="Dune",
+            author="Frank Herbert",
+            category="Science Fiction",
+            publisher="Ace",
+            publication_year=1965,
+            total_copies=3,
+            available_copies=3,
+            description="Roman SF classique"
+        )
 
-    dune = Book(
-        isbn="978-0-123456-78-9",
-        title="Dune",
-        author="Frank Herbert",
-        category="Science Fiction",
-        publisher="Ace",
-        publication_year=1965,
-        total_copies=3,
-        available_copies=3,
-        description="Roman SF classique"
-    )
+        repo.add_book(dune)
 
-    repo.add_book(dune)
+        # Les 3 lectures sont envoyées ensemble: temps total ~ la plus lente, pas la somme
+        f_isbn = repo.get_book_by_isbn_async(dune.isbn)
+        f_category = repo.get_books_by_category_async("Science Fiction")
+        f_author = repo.get_books_by_author_async("Frank Herbert")
 
-    print(repo.get_book_by_isbn(dune.isbn))
-    print(repo.get_books_by_category("Science Fiction"))
-    print(repo.get_books_by_author("Frank Herbert"))
-
-    db.close()
+        print(f_isbn.result().one())
+        print(list(f_category.result()))
+        print(f_author.result())
@@ -0,0 +1,8 @@
+from config.database import CassandraConnection
+
+if __name__ == "__main__":
+    # connect() complet (profil d'exécution, keyspace) puis une lecture: les Row doivent
+    # être des namedtuple (accès par attribut), comme l'attendent les repositories
+    with CassandraConnection() as session:
+        row = session.execute("SELECT release_version FROM system.local").one()
+        print("✅ Cassandra", row.release_version)
@@ -1,5 +1,13 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, Response
+from flask import (
+    Flask, render_template, stream_template, request, redirect, url_for, flash, Response,
+    get_flashed_messages,
+)
+from flask import session as web_session
+import time
 from uuid import UUID
+
+import orjson
+from cassandra import OperationTimedOut, Timeout
 from datetime import datetime, timezone
 
 from config.database import CassandraConnection
@@ -9,19 +17,107 @@ from models.borrow import BorrowRepository
 
 app = Flask(__name__)
 app.secret_key = "dev-secret-key"  # ok pour une démo
-
-# Connexion Cassandra (une session partagée suffit pour une démo)
-db = CassandraConnection()
-session = db.connect()
+# Templates compilés une fois pour toutes: pas de stat() du fichier à chaque rendu,
+# même si l'app est lancée en debug (à relancer après modification d'un template)
+app.config["TEMPLATES_AUTO_RELOAD"] = False
+for _template in app.jinja_env.list_templates():
+    app.jinja_env.get_template(_template)
+
+# Connexion Cassandra (une session partagée suffit pour une démo).
+# Délai court côté web: un nœud lent ne doit pas bloquer un worker au-delà de 2 s.
+db = CassandraConnection(request_timeout=2.0)
+# Pools ouverts vers tous les nœuds avant de servir; les repositories ci-dessous préparent
+# ensuite toutes leurs requêtes (le driver les prépare sur chaque nœud)
+session = db.connect(wait_for_all_pools=True)
 
 book_repo = BookRepository(session)
 user_repo = UserRepository(session)
 borrow_repo = BorrowRepository(session)
 
+# Cache mémoire (par process) des fiches livre lues par /books/search: isbn -> (expiration, row).
+# Le process qui traite un emprunt/retour retire l'entrée, mais pas les autres workers gunicorn
+# ni la CLI: available_copies affiché peut y rester faux jusqu'à BOOK_CACHE_TTL secondes.
+BOOK_CACHE_TTL = 5  # secondes
+BOOK_CACHE_MAX = 4096
+_book_cache = {}
+
+# Liste des livres: lignes lues par pages de LIST_FETCH_SIZE et envoyées au fil de l'eau.
+# Les petites listes (limit <= LIST_CACHE_MAX_ROWS) sont gardées LIST_CACHE_TTL secondes par
+# limit: limit -> (expiration, rows). Au-delà, pas de cache: une seule page en mémoire.
+LIST_FETCH_SIZE = 20
+LIST_LIMIT_MAX = 500  # borne serveur du champ "limit" (le max HTML ne protège que le navigateur)
+LIST_CACHE_TTL = 60  # secondes
+LIST_CACHE_MAX = 32
+LIST_CACHE_MAX_ROWS = 100
+_list_cache = {}
+
+
+def get_book_cached(isbn):
+    now = time.monotonic()
+    hit = _book_cache.get(isbn)
+    if hit and hit[0] > now:
+        return hit[1]
+
+    book = book_repo.get_book_by_isbn(isbn)
+    if book:
+        if len(_book_cache) >= BOOK_CACHE_MAX:
+            _book_cache.clear()
+        _book_cache[isbn] = (now + BOOK_CACHE_TTL, book)
+    return book
+
+
+def iter_books_cached(limit):
+    now = time.monotonic()
+    hit = _list_cache.get(limit)
+    if hit and hit[0] > now:
+        return hit[1]
+    if limit > LIST_CACHE_MAX_ROWS:
+        return book_repo.iter_books(limit=limit, fetch_size=LIST_FETCH_SIZE)
+    return _stream_and_cache_books(limit, now + LIST_CACHE_TTL)
+
+
+def _stream_and_cache_books(limit, expires_at):
+    # Les lignes sont rendues au fil de la lecture; la liste n'entre en cache
+    # qu'une fois le scan terminé (pas si le client coupe en cours de route)
+    rows = []
+    for row in book_repo.iter_books(limit=limit, fetch_size=LIST_FETCH_SIZE):
+        rows.append(row)
+        yield row
+    if len(_list_cache) >= LIST_CACHE_MAX:
+        _list_cache.clear()
+    _list_cache[limit] = (expires_at, rows)
+
+
+def wants_json():
+    # ?format=json: réponse JSON brute (clients machine), sans passer par Jinja
+    return request.args.get("format") == "json"
+
+
+def json_response(data, status=200):
+    # orjson sérialise nativement UUID et datetime (ISO 8601); les timestamps du driver
+    # sont naïfs en UTC, OPT_NAIVE_UTC ajoute le +00:00
+    return Response(orjson.dumps(data, option=orjson.OPT_NAIVE_UTC),
+                    status=status, mimetype="application/json")
+
+
+# Page d'accueil statique: rendue une fois au démarrage, servie telle quelle ensuite.
+# no-cache + Last-Modified: le navigateur revalide (304) au lieu de recharger la page,
+# mais ne sert jamais sa copie sans demander (un message flash peut être en attente).
+with app.test_request_context("/"):
+    _INDEX_HTML = render_template("index.html").encode()
+_INDEX_LAST_MODIFIED = datetime.now(timezone.utc).replace(microsecond=0)
+
 
 @app.route("/")
 def index():
-    return render_template("index.html")
+    if "_flashes" in web_session:
+        # Message en attente (ex. après un timeout Cassandra): rendu normal pour l'afficher
+        return render_template("index.html")
+
+    resp = Response(_INDEX_HTML, mimetype="text/html",
+                    headers={"Cache-Control": "no-cache"})
+    resp.last_modified = _INDEX_LAST_MODIFIED
+    return resp.make_conditional(request)
 
 
 
@@ -30,9 +126,10 @@ def index():
 @app.route("/users/register", methods=["GET", "POST"])
 def users_register():
     if request.method == "POST":
-        email = request.form["email"].strip()
-        first_name = request.form["first_name"].strip()
-        last_name = request.form["last_name"].strip()
+        form = request.form
+        email = form["email"].strip()
+        first_name = form["first_name"].strip()
+        last_name = form["last_name"].strip()
 
 
         user_id = user_repo.create_user(email, first_name, last_name)
@@ -51,16 +148,36 @@ def books_search():
     limit = 100
 
     if request.method == "POST":
-        action = request.form.get("action")
+        form = request.form
+        action = form.get("action")
 
         if action == "search":
-            isbn = request.form.get("isbn", "").strip()
+            isbn = form.get("isbn", "").strip()
             if isbn:
-                book = book_repo.get_book_by_isbn(isbn)
+                book = get_book_cached(isbn)
+            if wants_json():
+                return json_response(book._asdict() if book else None, 200 if book else 404)
 
         elif action == "list":
-            limit = int(request.form.get("limit", 100))
-            books = book_repo.list_books(limit=limit)
+            try:
+                limit = int(form.get("limit", 100))
+            except ValueError:
+                limit = 100
+            limit = min(max(limit, 1), LIST_LIMIT_MAX)
+            # Rendu en streaming: le HTML part dès la première page, une page en mémoire à la fois
+            books = iter_books_cached(limit)
+            if wants_json():
+                return json_response([b._asdict() for b in books])
+            # La session est enregistrée avant que le corps streamé soit rendu: les messages
+            # flash sont donc retirés de la session ici (Flask les garde pour le template),
+            # sinon ils réapparaîtraient à la page suivante
+            get_flashed_messages(with_categories=True)
+            return Response(stream_template(
+                "books_search.html",
+                book=book,
+                books=books,
+                limit=limit
+            ), mimetype="text/html")
 
     return render_template(
         "books_search.html",
@@ -93,9 +210,14 @@ def borrows():
     - retourner via email + isbn
     """
     if request.method == "POST":
-        action = request.form["action"]
-        email = request.form["email"].strip()
-        isbn = request.form["isbn"].strip()
+        form = request.form
+        action = form["action"]
+        email = form["email"].strip()
+        isbn = form["isbn"].strip()
+
+        # La lecture du livre ne dépend pas de l'utilisateur: elle part avant la résolution
+        # de l'email, les deux allers-retours se chevauchent
+        book_future = borrow_repo.get_book_async(isbn) if action == "borrow" else None
 
         user_id = user_repo.get_user_id_by_email(email)
         if not user_id:
@@ -103,36 +225,55 @@ def borrows():
             return redirect(url_for("borrows"))
 
         if action == "borrow":
-            res = borrow_repo.borrow_book(UUID(str(user_id)), isbn, loan_days=14)
+            res = borrow_repo.borrow_book(user_id, isbn, loan_days=14, book_future=book_future)
             flash(res.message, "success" if res.ok else "error")
         elif action == "return":
-            res = borrow_repo.return_book(UUID(str(user_id)), isbn)
+            res = borrow_repo.return_book(user_id, isbn)
             flash(res.message, "success" if res.ok else "error")
 
+        if action in ("borrow", "return") and res.message == "Utilisateur introuvable":
+            # user_id en cache périmé (email ré-inscrit ailleurs): relu au prochain essai
+            user_repo.forget_user_ids()
+
+        # available_copies a changé (ou a pu changer): la fiche et les listes en cache
+        # ne sont plus à jour
+        _book_cache.pop(isbn, None)
+        _list_cache.clear()
+
         return redirect(url_for("borrows"))
 
     return render_template("borrow.html")
 
 @app.route("/borrows/active", methods=["GET", "POST"])
-def borrows_active():
+@app.route("/borrows/active/<uuid:user_id>", methods=["GET"])
+def borrows_active(user_id=None):
+    # GET /borrows/active/<uuid>: l'UUID est déjà validé et converti par la route (lien direct)
     borrows = None
-    user_id_str = ""
+    user_id_str = str(user_id) if user_id else ""
+    # Calculé une seule fois. Naïf en UTC, comme les timestamps renvoyés par le driver
+    # (due_date), pour la comparaison faite dans le template.
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
 
-    if request.method == "POST":
+    if user_id is None and request.method == "POST":
         user_id_str = request.form.get("user_id", "").strip()
 
         try:
             user_id = UUID(user_id_str)
-        except Exception:
+        except ValueError:
+            if wants_json():
+                return json_response({"error": "User ID invalide (UUID attendu)"}, 400)
             flash("User ID invalide (UUID attendu)", "error")
             return render_template(
                 "borrows_active.html",
                 borrows=None,
                 user_id=user_id_str,
-                now=datetime.utcnow(),
+                now=now,
             )
 
+    if user_id is not None:
         borrows = borrow_repo.get_active_borrows_by_user(user_id)
+        if wants_json():
+            return json_response([b._asdict() for b in borrows])
 
         if not borrows:
             flash("Aucun emprunt actif pour cet utilisateur.", "info")
@@ -141,11 +282,23 @@ def borrows_active():
         "borrows_active.html",
         borrows=borrows,
         user_id=user_id_str,
-        now=datetime.utcnow(),
+        now=now,
     )
 
 
 
+@app.errorhandler(OperationTimedOut)
+@app.errorhandler(Timeout)
+def cassandra_timeout(e):
+    # OperationTimedOut: délai client (request_timeout) dépassé; Timeout: ReadTimeout/WriteTimeout
+    # renvoyés par le coordinateur
+    if wants_json():
+        return json_response({"error": "Base de données lente, réessaie"}, 503)
+    flash("Base de données lente, réessaie", "error")
+    # Pas de redirection vers un GET qui relancerait la même lecture
+    return redirect(request.path if request.method == "POST" else url_for("index"))
+
+
 @app.teardown_appcontext
 def shutdown_session(exception=None):
     # Pour une démo, on garde la connexion ouverte.
@@ -154,8 +307,10 @@ def shutdown_session(exception=None):
 
 @app.route("/favicon.ico")
 def favicon():
-    return Response(status=204)
+    # Pas d'icône: le navigateur garde ce 204 en cache et ne redemande plus à chaque page
+    return Response(status=204, headers={"Cache-Control": "public, max-age=31536000, immutable"})
 
 if __name__ == "__main__":
-    # http://127.0.0.1:5000
+    # Serveur de développement (http://127.0.0.1:5000): python -m web.app
+    # En production: gunicorn -c gunicorn.conf.py web.app:app (voir gunicorn.conf.py)
     app.run(debug=False)